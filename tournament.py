@@ -3,47 +3,301 @@
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
-import psycopg2
+import importlib
 import random
 import math
-import bleach
+import os
+import functools
+import threading
+import time
+import json
+import logging
+
+
+class LazyModule(object):
+    """ Stands in for a module, which is only imported the first time one of its
+        attributes is used. Keeps 'import tournament' fast for tools that never
+        reach the database or sanitize any input
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+psycopg2 = LazyModule("psycopg2")
+bleach = LazyModule("bleach")
+
+# Writes always go to the primary, read-only queries are spread over the replicas.
+# Both can be set from the environment, replicas as a ';' separated list of DSNs.
+PRIMARY_DSN = os.environ.get("SWISS_STYLE_PRIMARY", "dbname=swiss_style")
+REPLICA_DSNS = [dsn for dsn in os.environ.get("SWISS_STYLE_REPLICAS", "").split(";") if dsn]
+
+# A replica that cannot be reached is given REPLICA_CONNECT_TIMEOUT seconds to answer,
+# and is then skipped for REPLICA_COOLDOWN seconds. _replica_down_until maps the DSN
+# of each such replica to the time until which it is skipped
+REPLICA_CONNECT_TIMEOUT = 2
+REPLICA_COOLDOWN = 30
+_replica_down_until = {}
+
+
+class Session(threading.local):
+    """ State of this session, kept per thread:
+        write_location: WAL location of our last write on the primary, a replica must
+                        have replayed up to it before we read from it (read-your-writes)
+        write_lost:     True if the WAL location of our last write could not be read,
+                        reads then use the primary until a later write records it
+        primary_only:   greater than 0 while a write function runs, so its reads use the primary
+    """
+    def __init__(self):
+        self.write_location = None
+        self.write_lost = False
+        self.primary_only = 0
+
+
+_session = Session()
+
+# Change events from reportMatch and swissPairings are passed to every subscribed
+# callback in this process, and sent with NOTIFY on NOTIFY_CHANNEL for other processes
+# (set NOTIFY_CHANNEL to None to only publish in process). Publishing is best-effort,
+# failures are logged and never undo or fail the write the event is about
+NOTIFY_CHANNEL = "swiss_style"
+_subscribers = []
+
+# Player ids already resolved by name, keyed by (tournament_id, name, ignore_case),
+# as (player_id, time it expires at). Entries expire after PLAYER_CACHE_TTL seconds,
+# as other processes may delete or register players meanwhile, and a cached id may be
+# older than what a replica would return. Also cleared whenever this process deletes
+# players, per tournament when a player joins it, and once it holds PLAYER_CACHE_SIZE names
+PLAYER_CACHE_SIZE = 4096
+PLAYER_CACHE_TTL = 60
+_player_id_cache = {}
+
+
+def configureDatabase(primary="dbname=swiss_style", replicas=()):
+    """ Set the DSN of the primary database, and the list of DSNs of its read replicas
+        With no replicas, every query goes to the primary
+    """
+    global PRIMARY_DSN, REPLICA_DSNS
+    PRIMARY_DSN = primary
+    REPLICA_DSNS = list(replicas)
+    _replica_down_until.clear()
+    _session.write_location = None
+    _session.write_lost = False
+
+
+def getWriteLocation():
+    """ Returns the WAL location of this session's last write, or None if it has not written.
+        A session that spans threads or processes can pass it to useWriteLocation there
+    """
+    return _session.write_location
 
-def connect():
-    """Connect to the PostgreSQL database.  Returns a database connection."""
-    DB = psycopg2.connect("dbname=swiss_style")
+
+def useWriteLocation(location):
+    """ Make this thread's reads wait for the replicas to replay up to 'location', as
+        returned by getWriteLocation in the thread or process that made the writes
+    """
+    _session.write_location = location
+    _session.write_lost = False
+
+
+def connect(read_only=False):
+    """Connect to the PostgreSQL database.  Returns a database connection.
+        If 'read_only' is True and replicas are configured, connects to a random replica
+        that is up and has caught up with this session's writes, otherwise to the primary
+    """
+    if read_only and REPLICA_DSNS and _session.primary_only == 0 and not _session.write_lost:
+        now = time.time()
+        replicas = [dsn for dsn in REPLICA_DSNS if _replica_down_until.get(dsn, 0) <= now]
+        random.shuffle(replicas)
+        for dsn in replicas:
+            try:
+                DB = psycopg2.connect(dsn, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+            except psycopg2.OperationalError:
+                _replica_down_until[dsn] = time.time() + REPLICA_COOLDOWN
+                continue
+            caught_up = False
+            try:
+                caught_up = replicaHasCaughtUp(DB)
+            except psycopg2.Error:
+                _replica_down_until[dsn] = time.time() + REPLICA_COOLDOWN
+            finally:
+                if not caught_up:
+                    DB.close()
+            if caught_up:
+                return DB, DB.cursor()
+    DB = psycopg2.connect(PRIMARY_DSN)
     return DB, DB.cursor()
 
 
-def executeQuery(query, values=None):
+def replicaHasCaughtUp(DB):
+    """ Returns True if the replica connected to by 'DB' has replayed this session's last write"""
+    if _session.write_location is None:
+        return True
+    cur = DB.cursor()
+    cur.execute("SELECT pg_xlog_location_diff(pg_last_xlog_replay_location(), %s) >= 0",
+                (_session.write_location, ))
+    row = cur.fetchone()
+    return row[0] is True
+
+
+def onPrimary(function):
+    """ Decorator for functions that write to the database, all their queries
+        (including the reads they are based on) go to the primary
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        _session.primary_only += 1
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _session.primary_only -= 1
+    return wrapper
+
+
+def subscribe(callback):
+    """ Register 'callback' to be called with every change event, a dict with
+        'type' being either "match" or "pairings"
+    """
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    """ Stop calling 'callback' with change events"""
+    _subscribers.remove(callback)
+
+
+def publishEvent(event):
+    """ Pass 'event' to the subscribers of this process, and NOTIFY it to the other
+        processes LISTENing on NOTIFY_CHANNEL as json
+        The NOTIFY payload is limited to 8000 bytes, so it leaves out the pairings of
+        a "pairings" event, other processes fetch them with getSwissPairings
+    """
+    for callback in list(_subscribers):
+        try:
+            callback(event)
+        except Exception:
+            logging.getLogger(__name__).exception("Change event subscriber %r failed", callback)
+    if NOTIFY_CHANNEL is not None:
+        payload = dict((key, value) for key, value in event.items() if key != "pairings")
+        query = "SELECT pg_notify(%s, %s)"
+        values = (NOTIFY_CHANNEL, json.dumps(payload), )
+        try:
+            executeQuery(query, values)
+        except Exception:
+            logging.getLogger(__name__).exception("Could not NOTIFY %s on %s", payload, NOTIFY_CHANNEL)
+
+
+def executeQuery(query, values=None, read_only=False):
     """ Connect to database and execute the query that is passed
         Parameter 'values' can be a list of n elements, or can be None,
         in which case the query is fully described as is
+        Parameter 'read_only' allows the query to be sent to a read replica
     """
     rows = ['empty']
-    DB_connection, cur = connect()
-    if values is not None:
-        cur.execute(query, values)
-    else:
-        cur.execute(query)
-    DB_connection.commit()
+    DB_connection, cur = connect(read_only)
+    try:
+        if values is not None:
+            cur.execute(query, values)
+        else:
+            cur.execute(query)
+        DB_connection.commit()
+    except psycopg2.Error:
+        DB_connection.close()
+        raise
     try:
         rows = cur.fetchall()
     except psycopg2.ProgrammingError:
         pass
+    # Remember how far the primary got after a write, so later reads wait for the replicas
+    # to catch up. The write is already committed, so failing to do so must not raise
+    if not read_only and REPLICA_DSNS and not cur.statusmessage.startswith("SELECT"):
+        try:
+            cur.execute("SELECT pg_current_xlog_location()")
+            _session.write_location = cur.fetchone()[0]
+            _session.write_lost = False
+        except psycopg2.Error:
+            _session.write_lost = True
     DB_connection.close()
     return rows
 
 
-def registerTournament(name):
-    """ Register a tournament, of the name give by parameter 'name'"""
+# Tiebreakers that can be chained to order the standings, each one maps a
+# player to a value where higher ranks first:
+#   points:        player_points (2 for a win, 1 for a tie)
+#   wins:          number of matches won
+#   omw:           opponent match wins, total wins of all the opponents the player has faced
+#   defeated_wins: total wins of only the opponents the player has defeated
+# The default chain breaks ties on points and wins with defeated_wins, a Sonneborn-Berger
+# style tiebreak that ranks higher the player who beat the stronger opponents
+TIEBREAKERS = ("points", "wins", "omw", "defeated_wins")
+DEFAULT_TIEBREAKERS = ("points", "wins", "defeated_wins")
+
+
+def registerTournament(name, tiebreakers=None):
+    """ Register a tournament, of the name give by parameter 'name'
+        Parameter 'tiebreakers' is an optional sequence of names from TIEBREAKERS,
+        if not given the tournament uses DEFAULT_TIEBREAKERS
+    """
     bleach.clean(name)
 
-    query = "INSERT INTO tournaments (tournament_name) values (%s) RETURNING tournament_id;"
-    values = (name,)
+    if tiebreakers is None:
+        tiebreakers = DEFAULT_TIEBREAKERS
+    query = "INSERT INTO tournaments (tournament_name, tiebreakers) values (%s, %s) RETURNING tournament_id;"
+    values = (name, joinTiebreakers(tiebreakers))
     row = executeQuery(query, values)
     return row[0][0]            # row will only have one element, the tournament_id
 
 
+@onPrimary
+def setTiebreakers(tournament, tiebreakers):
+    """ Set the tiebreak chain used to order the standings of a tournament
+        Parameter 'tiebreakers' is a sequence of names from TIEBREAKERS, applied in order
+    """
+    # Sanitize input, in case it comes from web app/environment
+    bleach.clean(tournament)
+
+    tournament_id = getTournamentID(tournament)
+    query = "UPDATE tournaments set tiebreakers = %s where tournament_id = %s"
+    values = (joinTiebreakers(tiebreakers), tournament_id, )
+    executeQuery(query, values)
+
+
+def getTiebreakers(tournament_id):
+    """ Returns the tiebreak chain of the tournament given by 'tournament_id' as a tuple
+        If the tournament has none stored, returns DEFAULT_TIEBREAKERS
+    """
+    query = "SELECT tiebreakers from tournaments where tournament_id = %s"
+    values = (tournament_id, )
+    rows = executeQuery(query, values, read_only=True)
+    if len(rows) > 0 and rows[0][0]:
+        tiebreakers = tuple(rows[0][0].split(","))
+        checkTiebreakers(tiebreakers)
+        return tiebreakers
+    return DEFAULT_TIEBREAKERS
+
+
+def joinTiebreakers(tiebreakers):
+    """ Checks every name in 'tiebreakers' is known and returns them as the
+        comma separated string stored in the tournaments table
+    """
+    checkTiebreakers(tiebreakers)
+    return ",".join(tiebreakers)
+
+
+def checkTiebreakers(tiebreakers):
+    """ Raises a ValueError if 'tiebreakers' is empty, or if any name in it is not one of TIEBREAKERS"""
+    if len(tiebreakers) == 0:
+        raise ValueError("A tiebreak chain needs at least one of {0}".format(TIEBREAKERS))
+    for tiebreaker in tiebreakers:
+        if tiebreaker not in TIEBREAKERS:
+            raise ValueError("Unknown tiebreaker {0}, expected one of {1}".format(tiebreaker, TIEBREAKERS))
+
+
 def deleteMatches():
     """ Remove all the match records from the database."""
     query = "DELETE FROM swiss_pairs"
@@ -52,6 +306,8 @@ def deleteMatches():
     executeQuery(query)
     query = "DELETE FROM bye_list"
     executeQuery(query)
+    query = "DELETE FROM standings_snapshots"
+    executeQuery(query)
 
 
 def deleteTournaments():
@@ -73,13 +329,14 @@ def deleteSpecificPlayer(player_id):
     query = "DELETE FROM players where player_id = %s"
     values = (player_id, )
     executeQuery(query, values)
+    _player_id_cache.clear()
 
 
 def countPlayers():
     """ Count all players, across all tournaments
         Returns the number of players currently registered."""
     query = "SELECT count(*) from players;"
-    row = executeQuery(query)
+    row = executeQuery(query, read_only=True)
     return row[0][0]
 
 
@@ -91,10 +348,11 @@ def countPlayersInTournament(tournament):
     tournament_id = getTournamentID(tournament)
     query = "SELECT count(*) from tournament_contestants where tournament_id = %s"
     values = (tournament_id, )
-    rows = executeQuery(query, values)
+    rows = executeQuery(query, values, read_only=True)
     return rows[0][0]
 
 
+@onPrimary
 def registerPlayer(name, tournament="Default"):
     """Adds a player to the tournament database.
 
@@ -137,7 +395,7 @@ def getTournamentID(tournament):
     bleach.clean(tournament)
     query = "select tournament_id from tournaments where tournament_name = %s"
     values = (tournament, )
-    rows = executeQuery(query, values)
+    rows = executeQuery(query, values, read_only=True)
     # 1.b if no tournament doesn't exit, create it
     if len(rows) is not 0:
         tournament_id = rows[0][0]
@@ -148,7 +406,9 @@ def getTournamentID(tournament):
 
 
 def playerStandings(tournament="Default"):
-    """Returns a list of the players and their win records, sorted by wins.
+    """Returns a list of the players and their win records, sorted by the
+    tournament's tiebreak chain (by default points, then wins, then the
+    wins of the opponents each player defeated).
 
     The first entry in the list should be the player in first place, or a player
     tied for first place if there is currently a tie.
@@ -164,34 +424,19 @@ def playerStandings(tournament="Default"):
     bleach.clean(tournament)
 
     tournament_id = getTournamentID(tournament)
-    standings = []
+    tiebreakers = getTiebreakers(tournament_id)
 
-    # Find the players are tied by points
-    query = "SELECT a.player_id, b.player_id from getMatchesAndWins as a, getMatchesAndWins as b where a.player_points = b.player_points and a.player_id < b.player_id order by a.player_points"
-    tied_players_rows = executeQuery(query)
-
-    # Resolve them based on OMW.
-    reordered_rows = []
-    for tied_players in tied_players_rows:
-        tied_players = resolveOMW(tied_players[0], tied_players[1])
-        reordered_rows.append(tied_players)
-
-    # Get the player standings ranked by wins and player_points
+    # Get the player standings along with their wins and player_points
     query = "SELECT player_id, player_name, wins, matches, player_points from getMatchesAndWins where tournament_id = %s"
     values = (tournament_id,)
-    standings_rows = executeQuery(query, values)
-
-    # Rearrange the standings based on the tied pairs that need to be reordered based on OMW
-    for tied_pair in reordered_rows:
-        # Find the index where the player_id in tied_pair is in standings
-        for standings in standings_rows:
-            if tied_pair[0] == standings[0]:
-                index_p1 = standings_rows.index(standings)
-            if tied_pair[1] == standings[0]:
-                index_p2 = standings_rows.index(standings)
-        # Swap the rows in case they are incorrectly ordered based on OMW
-        if index_p1 > index_p2:
-            standings_rows[index_p1], standings_rows[index_p2] = standings_rows[index_p2], standings_rows[index_p1]
+    standings_rows = executeQuery(query, values, read_only=True)
+
+    # Get every match of the tournament in one go, the tiebreakers are computed from these
+    query = "SELECT player1_id, player2_id, winner_id, tied from match_list where tournament_id = %s"
+    match_rows = executeQuery(query, values, read_only=True)
+
+    # Order the standings with a single sort, using the tournament's tiebreak chain
+    standings_rows.sort(key=standingsSortKey(standings_rows, match_rows, tiebreakers))
 
     # We only need player_id, player_name, wins, matches to return
     player_standings = []
@@ -206,6 +451,7 @@ def printStandings(standings):
         print(str(row[0]).ljust(10)+str(row[1]).ljust(20)+str(row[2]).ljust(10)+str(row[3]).ljust(10))
 
 
+@onPrimary
 def reportMatch(winner, loser, tied=0, tournament="Default"):
 
     """Records the outcome of a single match between two players.
@@ -223,11 +469,13 @@ def reportMatch(winner, loser, tied=0, tournament="Default"):
     bleach.clean(tied)
 
     tournament_id = getTournamentID(tournament)
+    # Standing deltas of the match, as (player_id, wins, matches, player_points)
     if tied == 0:
         values_report_match = (tournament_id, winner, loser, winner, tied)
         query2 = "UPDATE tournament_contestants set player_points = player_points + 2 where player_id = %s"
         values2 = (winner,)
         executeQuery(query2, values2)
+        deltas = [(winner, 1, 1, 2), (loser, 0, 1, 0)]
     else:
         values_report_match = (tournament_id, winner, loser, -1, tied)
         query2 = "UPDATE tournament_contestants set player_points = player_points + 1 where player_id = %s"
@@ -235,23 +483,91 @@ def reportMatch(winner, loser, tied=0, tournament="Default"):
         executeQuery(query2, values2)
         values2 = (loser,)
         executeQuery(query2, values2)
+        deltas = [(winner, 0, 1, 1), (loser, 0, 1, 1)]
     query_report_match = "INSERT into match_list (tournament_id, player1_id, player2_id, winner_id, tied) values (%s, %s, %s, %s, %s)"
     rows = executeQuery(query_report_match, values_report_match)
 
+    # A bye is reported against player -1, who has no standing to update
+    deltas = [delta for delta in deltas if delta[0] != -1]
+    publishEvent({"type": "match", "tournament_id": tournament_id,
+                  "winner": winner, "loser": loser, "tied": tied, "deltas": deltas})
+
 
 def getPlayerId(name):
-    """ Returns player_id based on the player's name given by parameter 'name' """
+    """ Returns player_id based on the player's name given by parameter 'name'
+        If several players share the name, returns the one registered first
+    """
     # Sanitize input, in case it comes from web app/environment
     bleach.clean(name)
 
-    query = "select player_id from players where player_name = %s;"
+    key = (None, name, False)
+    player_id = cachedPlayerId(key)
+    if player_id is not None:
+        return player_id
+    query = "select player_id from players where player_name = %s order by player_id limit 1;"
     values = (name, )
-    rows = executeQuery(query, values)
+    rows = executeQuery(query, values, read_only=True)
     if len(rows) > 0:
+        cachePlayerId(key, rows[0][0])
         return rows[0][0]
     else: return 'Not found'
 
 
+def getPlayerIds(names, tournament="Default", ignore_case=False):
+    """ Resolves many player names at once, in one query, among the players of 'tournament'
+        Returns a dict of name to player_id, the player_id is None for names not found.
+        If several players share a name, the one registered first is returned.
+        With 'ignore_case', names are matched case-insensitively
+    """
+    # Sanitize input, in case it comes from web app/environment
+    bleach.clean(tournament)
+    for name in names:
+        bleach.clean(name)
+
+    tournament_id = getTournamentID(tournament)
+    player_ids = {}
+    missing_names = []
+    for name in names:
+        player_ids[name] = cachedPlayerId((tournament_id, name, ignore_case))
+        if player_ids[name] is None:
+            missing_names.append(name)
+
+    if len(missing_names) > 0:
+        # Both are indexed, see players_name_index and players_lower_name_index.
+        # Names are lowercased on both sides by Postgres, so they follow the database locale
+        if ignore_case:
+            condition = "lower(players.player_name) = lower(lookup_name)"
+        else:
+            condition = "players.player_name = lookup_name"
+        query = "SELECT lookup_name, min(players.player_id) " \
+                "from unnest(%s) as lookup_name, players, tournament_contestants " \
+                "where players.player_id = tournament_contestants.player_id " \
+                "and tournament_contestants.tournament_id = %s and {0} " \
+                "group by lookup_name".format(condition)
+        values = (list(set(missing_names)), tournament_id, )
+        found = dict(executeQuery(query, values, read_only=True))
+        for name in missing_names:
+            player_ids[name] = found.get(name)
+            if player_ids[name] is not None:
+                cachePlayerId((tournament_id, name, ignore_case), player_ids[name])
+    return player_ids
+
+
+def cachedPlayerId(key):
+    """ Returns the player_id cached for 'key', or None if it is not cached or has expired"""
+    entry = _player_id_cache.get(key)
+    if entry is None or entry[1] <= time.time():
+        return None
+    return entry[0]
+
+
+def cachePlayerId(key, player_id):
+    """ Remember the player_id resolved for 'key', starting over when the cache is full"""
+    if len(_player_id_cache) >= PLAYER_CACHE_SIZE:
+        _player_id_cache.clear()
+    _player_id_cache[key] = (player_id, time.time() + PLAYER_CACHE_TTL)
+
+
 def registerContestants(player, tournament):
     """ Registers the contestants per tournament
         Done for the case when multiple tournaments exist
@@ -263,8 +579,13 @@ def registerContestants(player, tournament):
     query = "INSERT INTO tournament_contestants values (%s, %s);"
     values = (tournament, player, )
     executeQuery(query, values)
+    # The player may share a name with, and have registered before, a player already cached
+    for key in list(_player_id_cache):
+        if key[0] == tournament:
+            del _player_id_cache[key]
 
 
+@onPrimary
 def swissPairings(tournament="Default"):
     """ Generate the swiss pairings for a given tournament. if tournament is not
         given, then creates swiss pairs out of the default tournament playerStandings
@@ -303,6 +624,8 @@ def swissPairings(tournament="Default"):
         # Then we check if all the elements (matches played of all players) is the same
         all_played_same_matches = all(x == matches_played[0] for x in matches_played)
         if all_played_same_matches:
+            # 2b. keep a snapshot of the standings after the round everyone has played
+            snapshotStandings(tournament_id, matches_played[0], standings)
             # 3. if each player has played the same number of matches, check if matches played = max
             if matches_played[0] == total_matches:
                 print("We have played all the matches possible in this Swiss Style Tournament")
@@ -313,10 +636,12 @@ def swissPairings(tournament="Default"):
                 # 5. generate swiss pairing by sorting players by their standings/bye
                 player_pairs = getPlayerPairs(players_by_wins_bye)
                 query = "INSERT into swiss_pairs values (%s, %s, %s, %s)"
-                # The current round number is calculated by 2 ^ (matches played/total players/2)
+                # The current round is the one after the matches everyone has played
                 for pair in player_pairs:
-                    values = (tournament_id, pair[0], pair[2], 2**round(matches_played[0]/(count_players/2)),)
+                    values = (tournament_id, pair[0], pair[2], matches_played[0] + 1,)
                     executeQuery(query, values)
+                publishEvent({"type": "pairings", "tournament_id": tournament_id,
+                              "round": matches_played[0] + 1, "pairings": player_pairs})
         else:
             print("We have players who still haven't played in this round, as follows: ")
             for row in rows:
@@ -325,6 +650,71 @@ def swissPairings(tournament="Default"):
     return player_pairs
 
 
+def snapshotStandings(tournament_id, swiss_round, standings):
+    """ Store the standings of the tournament after round 'swiss_round' (the number of
+        matches every player has played), if they have not been stored yet.
+        Snapshots are never updated, so they can be served without recomputing them
+    """
+    if len(standings) == 0:
+        return
+    # Check and insert in one statement, so only the first call for a round stores it
+    rows = []
+    values = []
+    for position, row in enumerate(standings):
+        rows.append("(%s, %s, %s, %s, %s, %s, %s)")
+        values += [tournament_id, swiss_round, position, row[0], row[1], row[2], row[3]]
+    query = "INSERT into standings_snapshots SELECT * from (values " + ", ".join(rows) + ") as snapshot " \
+            "where not exists (SELECT 1 from standings_snapshots where tournament_id = %s and round = %s)"
+    values += [tournament_id, swiss_round]
+    try:
+        executeQuery(query, values)
+    except psycopg2.IntegrityError:
+        # A concurrent call stored the same round's snapshot first
+        pass
+
+
+def getStandingsSnapshot(tournament="Default", swiss_round=None):
+    """ Returns the standings of the tournament as they were after round 'swiss_round',
+        in the same form as playerStandings. If 'swiss_round' is None, returns
+        the latest snapshot. Returns an empty list if there is no such snapshot
+    """
+    # Sanitize input, in case it comes from web app/environment
+    bleach.clean(tournament)
+
+    tournament_id = getTournamentID(tournament)
+    if swiss_round is None:
+        query = "SELECT max(round) from standings_snapshots where tournament_id = %s"
+        values = (tournament_id, )
+        swiss_round = executeQuery(query, values, read_only=True)[0][0]
+    query = "SELECT player_id, player_name, wins, matches from standings_snapshots " \
+            "where tournament_id = %s and round = %s order by position"
+    values = (tournament_id, swiss_round, )
+    return executeQuery(query, values, read_only=True)
+
+
+def getSwissPairings(tournament="Default", swiss_round=None):
+    """ Returns the pairings of round 'swiss_round' of the tournament, as returned by
+        swissPairings when that round was paired. If 'swiss_round' is None, returns
+        the pairings of the latest round
+    """
+    # Sanitize input, in case it comes from web app/environment
+    bleach.clean(tournament)
+
+    tournament_id = getTournamentID(tournament)
+    if swiss_round is None:
+        query = "SELECT max(round) from swiss_pairs where tournament_id = %s"
+        values = (tournament_id, )
+        swiss_round = executeQuery(query, values, read_only=True)[0][0]
+    # A bye is stored as a pair whose player2_id is null
+    query = "SELECT swiss_pairs.player1_id, player1.player_name, swiss_pairs.player2_id, " \
+            "coalesce(player2.player_name, 'bye') from swiss_pairs " \
+            "join players as player1 on swiss_pairs.player1_id = player1.player_id " \
+            "left join players as player2 on swiss_pairs.player2_id = player2.player_id " \
+            "where swiss_pairs.tournament_id = %s and swiss_pairs.round = %s"
+    values = (tournament_id, swiss_round, )
+    return [tuple(row) for row in executeQuery(query, values, read_only=True)]
+
+
 def giveBye(standings, tournament_id):
     """ In case of making swiss pairs for an odd number of players in
         the tournament, one player needs to be given a bye.
@@ -368,85 +758,45 @@ def getPlayerPairs(players):
     return player_pairs
 
 
-def resolveOMW(player1, player2, tournament="Default"):
-    """ Input:
-        player1 : player's id
-        player2 : player's id
-        player1 and player 2 are ordered
-        (i.e. if player of id 7 is ranked above id 3, player1 = 7, player2 = 3)
+def standingsSortKey(standings_rows, match_rows, tiebreakers):
+    """ Returns a sort key for rows of (player_id, player_name, wins, matches, player_points)
+        Input:
+        standings_rows : the rows of the tournament's standings
+        match_rows     : the rows of (player1_id, player2_id, winner_id, tied) of the tournament
+        tiebreakers    : the names of the tiebreakers to apply, in order
 
         Logic:
-        1. get all players player1 has played with
-        2. get all players player2 has played with
-        3. make a list of players both players have played with
-        4. add both players themselves to the list of common players
-          - this is done to make sure we find out who won the match(es) between those
-            two players as well as for player2,
-            calculate all the players from common list they have won against
-        5. Find out who won matches between player 1 and common list, and then
-                                    between player 2 and common list
-        6. See how many games against common opponents has player1 won and player2 won
-        7. if player 2 has won more games than player 1, swap their order
-
+        1. index the wins and points of each player by player_id
+        2. in one pass over the matches, total the wins of each player's opponents
+           and of the opponents each player has defeated (byes have no opponent)
+        3. the key is every tiebreaker, highest first, ending with the player_id
+           so that players still tied keep the order they registered in
     """
-    # Sanitize input, in case it comes from web app/environment
-    bleach.clean(tournament)
-
-    # 1. get all players player1 has played with
-    tournament_id = getTournamentID(tournament)
-    query = "SELECT player2_id from match_list where player1_id = %s and tournament_id = %s"
-    values = (player1, tournament_id, )
-    rows = executeQuery(query, values)
-    players_p1_played_with = [row[0] for row in rows]
-
-    query = "SELECT player1_id from match_list where player2_id = %s and tournament_id = %s"
-    values = (player1, tournament_id, )
-    rows = executeQuery(query, values)
-    players_p1_played_with+= [row[0] for row in rows]
-
-    # 2. get all players player2 has played with
-    query = "SELECT player2_id from match_list where player1_id = %s and tournament_id = %s"
-    values = (player2, tournament_id, )
-    rows = executeQuery(query, values)
-    players_p2_played_with = [row[0] for row in rows]
-
-    query = "SELECT player1_id from match_list where player2_id = %s and tournament_id = %s"
-    values = (player2, tournament_id, )
-    rows = executeQuery(query, values)
-    players_p2_played_with+=[row[0] for row in rows]
-
-    # 3. make a list of players both players have played with
-    common_players_list = list(frozenset(players_p1_played_with).intersection(players_p2_played_with))
-
-    # 4. add both players themselves to the list of common players
-    #    - this is done to make sure we find out who won the match(es) between those
-    #      two players as well
-    common_players_list.append(player1)
-    common_players_list.append(player2)
-
-    # 5. Find out who won matches between player 1 and common list, and then
-    #                             between player 2 and common list
-    player1_vs_common_matches = []  # contains the winner id between player1 and corresponding common player
-    player2_vs_common_matches = []  # contains the winner id between player2 and corresponding common player
-    for common_player in common_players_list:
-        query = "SELECT winner_id from match_list where player1_id = %s and player2_id = %s" \
-                "or player2_id = %s and player1_id = %s"
-        values = (player1, common_player, player1, common_player,)
-        rows = executeQuery(query, values)
-        player1_vs_common_matches += [row[0] for row in rows]
-        values = (player2, common_player, player2, common_player,)
-        rows = executeQuery(query, values)
-        player2_vs_common_matches += [row[0] for row in rows]
-
-    # 6. See how many games against common opponents has player1 won and player2 won
-    #    From the list of winner_ids for matches between player1 and
-    #    common list (and player2 and common list), we count how often winner_id = player1_id
-    #    and how often winner_id = player2_id
-    matches_p1_won_against_common = player1_vs_common_matches.count(player1)
-    matches_p2_won_against_common = player2_vs_common_matches.count(player2)
-
-    # 7. if player 2 has won more games than player 1, swap their order
-    if matches_p1_won_against_common < matches_p2_won_against_common:
-        return (player2, player1)
-    else:
-        return (player1, player2)
+    # 1. index the wins and points of each player by player_id
+    wins = {}
+    points = {}
+    for row in standings_rows:
+        wins[row[0]] = row[2]
+        points[row[0]] = row[4]
+
+    # 2. total the wins of each player's opponents, and of the opponents they defeated
+    opponent_wins = dict((player_id, 0) for player_id in wins)
+    defeated_wins = dict((player_id, 0) for player_id in wins)
+    for player1, player2, winner, tied in match_rows:
+        if player1 not in wins or player2 not in wins:
+            continue
+        opponent_wins[player1] += wins[player2]
+        opponent_wins[player2] += wins[player1]
+        if tied == 0 and winner == player1:
+            defeated_wins[player1] += wins[player2]
+        elif tied == 0 and winner == player2:
+            defeated_wins[player2] += wins[player1]
+
+    values = {"points": points, "wins": wins, "omw": opponent_wins, "defeated_wins": defeated_wins}
+    chain = [values[tiebreaker] for tiebreaker in tiebreakers]
+
+    # 3. every tiebreaker is negated so a plain ascending sort ranks the highest first
+    def key(row):
+        return tuple(-tiebreaker[row[0]] for tiebreaker in chain) + (row[0],)
+
+    return key
@@ -16,7 +16,8 @@ DROP TABLE IF EXISTS tournaments;
 CREATE TABLE IF NOT EXISTS tournaments
 (
     tournament_id       serial primary key,
-    tournament_name     text
+    tournament_name     text,
+    tiebreakers         text DEFAULT 'points,wins,defeated_wins'
 );
 
 DROP TABLE IF EXISTS players;
@@ -26,6 +27,15 @@ CREATE TABLE IF NOT EXISTS players
     player_name         text
 );
 
+-- Lookups of players by name, exact (getPlayerId, getPlayerIds) and case-insensitive
+-- (getPlayerIds with ignore_case)
+CREATE INDEX players_name_index ON players (player_name);
+CREATE INDEX players_lower_name_index ON players (lower(player_name));
+
+-- Optionally, for fuzzy/partial name searches (needs the pg_trgm contrib module):
+-- CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- CREATE INDEX players_name_trgm_index ON players USING gin (player_name gin_trgm_ops);
+
 DROP TABLE IF EXISTS tournament_contestants;
 CREATE TABLE IF NOT EXISTS tournament_contestants
 (
@@ -65,6 +75,19 @@ CREATE TABLE IF NOT EXISTS bye_list
     player_id           integer
 );
 
+DROP TABLE IF EXISTS standings_snapshots;
+CREATE TABLE IF NOT EXISTS standings_snapshots
+(
+    tournament_id       integer references tournaments ON DELETE CASCADE,
+    round               integer,
+    position            integer,
+    player_id           integer,
+    player_name         text,
+    wins                integer,
+    matches             integer,
+    primary key (tournament_id, round, position)
+);
+
 
 DROP VIEW IF EXISTS getWins;
 CREATE VIEW getWins AS
@@ -13,6 +13,8 @@ DROP VIEW getWins;
 
 DROP VIEW getMatches;
 
+DROP TABLE standings_snapshots;
+
 DROP TABLE bye_list;
 
 DROP TABLE swiss_pairs;
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# tournament_importtime.py -- checks that 'import tournament' stays fast
+#
+# Imports tournament.py in a fresh interpreter and fails if it imports any of
+# LAZY_MODULES, which should only be imported once they are used, or if the import
+# takes longer than IMPORT_TIME_RATIO times the startup of a bare interpreter
+# ("python -c pass") on the same machine. Comparing against the startup, rather
+# than a fixed time, keeps the check independent of how fast the machine is.
+# The import is timed with "python -X importtime" on Python 3.7 or later, and
+# directly in the child interpreter on older versions.
+
+import os
+import subprocess
+import sys
+import time
+
+LAZY_MODULES = ("psycopg2", "bleach")
+# At most how many times the bare interpreter startup importing tournament may take
+IMPORT_TIME_RATIO = 5
+# Every time is the fastest of this many runs, to leave out a busy machine's noise
+IMPORT_TIME_RUNS = 3
+
+
+def runPython(arguments):
+    """ Run a fresh interpreter from this directory with 'arguments',
+        and return its (stdout, stderr)
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable] + arguments, cwd=directory,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    output, errors = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError("Could not import tournament:\n" + errors)
+    return output, errors
+
+
+def eagerModules():
+    """ Returns the modules of LAZY_MODULES that importing tournament imports"""
+    code = "import sys, tournament\n" \
+           "print(' '.join(m for m in {0!r} if m in sys.modules))".format(LAZY_MODULES)
+    output = runPython(["-c", code])[0]
+    return output.split()
+
+
+def startupTime():
+    """ Returns how long a bare interpreter takes to start and exit, in microseconds"""
+    start = time.time()
+    runPython(["-c", "pass"])
+    return int((time.time() - start) * 1000000)
+
+
+def importTime():
+    """ Returns how long importing tournament takes in a fresh interpreter, in microseconds"""
+    if sys.version_info < (3, 7):
+        code = "import time\n" \
+               "start = time.time()\n" \
+               "import tournament\n" \
+               "print(int((time.time() - start) * 1000000))"
+        return int(runPython(["-c", code])[0])
+    errors = runPython(["-X", "importtime", "-c", "import tournament"])[1]
+    for line in errors.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and line.split("|")[2].strip() == "tournament":
+            return int(line.split("|")[1])
+    raise RuntimeError("python -X importtime did not report importing tournament")
+
+
+def checkImportTime():
+    eager_modules = eagerModules()
+    if eager_modules:
+        raise ValueError(
+            "Importing tournament should not import {0}.".format(", ".join(eager_modules)))
+    print("Importing tournament does not import {0}".format(", ".join(LAZY_MODULES)))
+
+    # The first import may also have to compile tournament.py, leave it out
+    importTime()
+    startup_us = min(startupTime() for run in range(IMPORT_TIME_RUNS))
+    import_us = min(importTime() for run in range(IMPORT_TIME_RUNS))
+    print("Importing tournament took {0} us, starting the interpreter {1} us (limit {2}x)".format(
+        import_us, startup_us, IMPORT_TIME_RATIO))
+    if import_us > IMPORT_TIME_RATIO * startup_us:
+        raise ValueError(
+            "Importing tournament took more than {0} times the interpreter startup.".format(IMPORT_TIME_RATIO))
+
+
+if __name__ == '__main__':
+    checkImportTime()
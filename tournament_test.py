@@ -2,7 +2,10 @@
 #
 # Test cases for tournament.py
 
+import os
+import time
 from tournament import *
+from tournament_importtime import checkImportTime
 
 def testDeleteMatches():
     deleteMatches()
@@ -190,7 +193,7 @@ def testMultipleTournaments():
     print "\n11. Correct number of players in both tournaments. \n\n"
 
 
-def testOMW():
+def testDefeatedWins():
     deleteMatches()
     deletePlayers()
     id1 = registerPlayer("Robert Plant")
@@ -211,7 +214,8 @@ def testOMW():
 
     # Player 1 and player 3 have both won the same number of matches - 2 each
     # but Player 3 has defeated Player 5 while Player 1 lost to Player 5.
-    # Based on this, the OMW should state that Player 3 ranks higher than Player 1
+    # Based on this, the wins of the opponents they defeated (Sonneborn-Berger style)
+    # should state that Player 3 ranks higher than Player 1
 
     standings = playerStandings()
     printStandings(standings)
@@ -219,8 +223,185 @@ def testOMW():
     actual_standings = [standings[0][0], standings[1][0], standings[2][0], standings[3][0], standings[4][0]]
     if actual_standings!=expected_standings:
         raise ValueError(
-            "Players are not ranked in correct order as per OMW.")
-    print "\n12. The players are ranked as per OMW when tied for wins.\n\n"
+            "Players are not ranked in correct order as per the wins of the opponents they defeated.")
+    print "\n12. The players are ranked as per the wins of the opponents they defeated when tied for wins.\n\n"
+
+
+def testTiebreakChain():
+    deleteTournaments()
+    deleteMatches()
+    deletePlayers()
+    try:
+        registerTournament("Blitz", ())
+    except ValueError:
+        pass
+    else:
+        raise ValueError("An empty tiebreak chain should be rejected.")
+    registerTournament("Blitz", ("points", "wins", "omw"))
+    id1 = registerPlayer("Robert Plant", "Blitz")
+    id2 = registerPlayer("Jimmy Page", "Blitz")
+    id3 = registerPlayer("John Paul Jones", "Blitz")
+    id4 = registerPlayer("John Bonham", "Blitz")
+    id5 = registerPlayer("Jimmi Hendrix", "Blitz")
+    # Same matches as testDefeatedWins
+    reportMatch(id1, id2, 0, "Blitz")
+    reportMatch(id5, id1, 0, "Blitz")
+    reportMatch(id3, id5, 0, "Blitz")
+    reportMatch(id3, id4, 0, "Blitz")
+    reportMatch(id1, id2, 0, "Blitz")
+
+    # Player 1 and Player 3 have both faced opponents with one win in total,
+    # so with opponent match wins as the last tiebreaker they stay in registration order
+    standings = playerStandings("Blitz")
+    printStandings(standings)
+    expected_standings = [id1, id3, id5, id2, id4]
+    actual_standings = [row[0] for row in standings]
+    if actual_standings != expected_standings:
+        raise ValueError(
+            "Players are not ranked in correct order as per the tournament's tiebreak chain.")
+
+    # Switching the chain back to the wins of defeated opponents ranks Player 3 above Player 1 again
+    setTiebreakers("Blitz", ("points", "wins", "defeated_wins"))
+    standings = playerStandings("Blitz")
+    expected_standings = [id3, id1, id5, id2, id4]
+    actual_standings = [row[0] for row in standings]
+    if actual_standings != expected_standings:
+        raise ValueError(
+            "Players are not ranked in correct order after changing the tiebreak chain.")
+    print "\n13. The players are ranked as per each tournament's tiebreak chain.\n\n"
+
+
+def testReadReplicas():
+    """ Needs a second local Postgres instance, streaming from the first one,
+        whose DSN is given by the environment variable SWISS_STYLE_TEST_REPLICA
+    """
+    replica = os.environ.get("SWISS_STYLE_TEST_REPLICA")
+    if replica is None:
+        print "\n14. Skipped read replica routing, SWISS_STYLE_TEST_REPLICA is not set.\n\n"
+        return
+    configureDatabase(PRIMARY_DSN, [replica])
+    try:
+        deleteMatches()
+        deletePlayers()
+        # Reads must see our own writes straight away, even if they are routed to the replica
+        for i in range(10):
+            registerPlayer("Player {0}".format(i))
+            if countPlayers() != i + 1:
+                raise ValueError(
+                    "Reads after a write should see that write (read-your-writes).")
+        # Once the replica has caught up, read-only queries are served by it
+        for attempt in range(50):
+            DB, cur = connect(read_only=True)
+            cur.execute("SELECT pg_is_in_recovery()")
+            on_replica = cur.fetchone()[0]
+            DB.close()
+            if on_replica:
+                break
+            time.sleep(0.1)
+        if not on_replica:
+            raise ValueError(
+                "Read-only queries should be routed to the replica.")
+        DB, cur = connect()
+        cur.execute("SELECT pg_is_in_recovery()")
+        on_replica = cur.fetchone()[0]
+        DB.close()
+        if on_replica:
+            raise ValueError(
+                "Writes should be routed to the primary.")
+    finally:
+        configureDatabase(PRIMARY_DSN)
+    print "\n14. Reads are routed to the replica and see this session's writes.\n\n"
+
+
+def failingSubscriber(event):
+    raise RuntimeError("Subscriber failed on purpose.")
+
+
+def testChangeFeed():
+    deleteMatches()
+    deletePlayers()
+    events = []
+    subscribe(events.append)
+    try:
+        id1 = registerPlayer("Bruno Walton")
+        id2 = registerPlayer("Boots O'Neal")
+        id3 = registerPlayer("Cathy Burton")
+        id4 = registerPlayer("Diane Grant")
+        pairings = swissPairings()
+        if events[-1]["type"] != "pairings" or events[-1]["round"] != 1 or events[-1]["pairings"] != pairings:
+            raise ValueError(
+                "swissPairings should publish the new pairings.")
+        if set(getSwissPairings("Default", 1)) != set(pairings):
+            raise ValueError(
+                "The pairings of a round should be fetched back by its round number.")
+        reportMatch(id1, id2)
+        reportMatch(id3, id4, 1)
+        if events[-2]["deltas"] != [(id1, 1, 1, 2), (id2, 0, 1, 0)]:
+            raise ValueError(
+                "reportMatch should publish the standing deltas of a won match.")
+        if events[-1]["deltas"] != [(id3, 0, 1, 1), (id4, 0, 1, 1)]:
+            raise ValueError(
+                "reportMatch should publish the standing deltas of a tied match.")
+        swissPairings()
+        standings = playerStandings()
+        snapshot = [tuple(row) for row in getStandingsSnapshot("Default", 1)]
+        if snapshot != standings or getStandingsSnapshot() != getStandingsSnapshot("Default", 1):
+            raise ValueError(
+                "After the first round, its snapshot should match the standings.")
+        reportMatch(id2, id4)
+        if [tuple(row) for row in getStandingsSnapshot("Default", 1)] != snapshot:
+            raise ValueError(
+                "A round's snapshot should not change after later matches.")
+        # A failing subscriber should not fail the match, which is already recorded
+        subscribe(failingSubscriber)
+        try:
+            reportMatch(id1, id3)
+        finally:
+            unsubscribe(failingSubscriber)
+        if events[-1]["deltas"] != [(id1, 1, 1, 2), (id3, 0, 1, 0)]:
+            raise ValueError(
+                "Other subscribers should still get events when one of them fails.")
+    finally:
+        unsubscribe(events.append)
+    print "\n15. Matches and pairings publish change events, and each round keeps a snapshot.\n\n"
+
+
+def testPlayerLookup():
+    deleteMatches()
+    deletePlayers()
+    id1 = registerPlayer("Pete Sampras", "Wimbledon")
+    id2 = registerPlayer("Andre Agassi", "Wimbledon")
+    id3 = registerPlayer("Roger Federer", "US Open")
+    if getPlayerId("Andre Agassi") != id2 or getPlayerId("Steffi Graf") != 'Not found':
+        raise ValueError(
+            "getPlayerId should return the player's id, or 'Not found'.")
+    player_ids = getPlayerIds(["Pete Sampras", "Andre Agassi", "Roger Federer"], "Wimbledon")
+    if player_ids != {"Pete Sampras": id1, "Andre Agassi": id2, "Roger Federer": None}:
+        raise ValueError(
+            "getPlayerIds should only resolve the names of players in the tournament.")
+    player_ids = getPlayerIds(["pete sampras", "ANDRE AGASSI"], "Wimbledon", ignore_case=True)
+    if player_ids != {"pete sampras": id1, "ANDRE AGASSI": id2}:
+        raise ValueError(
+            "getPlayerIds should resolve names case-insensitively with ignore_case.")
+    # A player registered earlier under the same name joining the tournament takes precedence
+    id4 = registerPlayer("Roger Federer", "Wimbledon")
+    if getPlayerIds(["Roger Federer"], "Wimbledon") != {"Roger Federer": id4}:
+        raise ValueError(
+            "getPlayerIds should resolve the player of the same name in the tournament.")
+    registerContestants(id3, getTournamentID("Wimbledon"))
+    if getPlayerIds(["Roger Federer"], "Wimbledon") != {"Roger Federer": id3}:
+        raise ValueError(
+            "Players joining a tournament should not be hidden by the cache.")
+    deleteSpecificPlayer(id1)
+    if getPlayerIds(["Pete Sampras"], "Wimbledon") != {"Pete Sampras": None}:
+        raise ValueError(
+            "Deleted players should not be resolved from the cache.")
+    print "\n16. Players are resolved by name, one at a time or in a batch per tournament.\n\n"
+
+
+def testImportTime():
+    checkImportTime()
+    print "\n17. Importing tournament leaves its optional dependencies until they are used.\n\n"
 
 
 def testCompleteSwissPairing():
@@ -244,7 +425,7 @@ def testCompleteSwissPairing():
     if expected_names_order != actual_names_order:
         raise ValueError(
             "After one entire tournament's swiss pairing with even players, player standings order is incorrect.")
-    print "\n13. After one entire tournament's swiss pairing with even players, correct player standings. \n\n"
+    print "\n18. After one entire tournament's swiss pairing with even players, correct player standings. \n\n"
 
 
 def autoSwissPairing():
@@ -306,8 +487,23 @@ if __name__ == '__main__':
                                 # and register players that are in both tournaments
                                 # independently as well as jointly
 
-    testOMW()   # When two players have the same number of wins, they are ranked
-                # by the OMW (Opponent Match Wins)
+    testDefeatedWins()  # When two players have the same number of wins, they are ranked
+                        # by the wins of the opponents they defeated
+
+    testTiebreakChain()     # Each tournament can configure the chain of
+                            # tiebreakers its standings are ordered by
+
+    testReadReplicas()  # Read-only queries go to a replica when one is configured,
+                        # and still see the writes made by this session
+
+    testChangeFeed()    # Reporting matches and pairing rounds publish change events,
+                        # and the standings of every round are kept as a snapshot
+
+    testPlayerLookup()  # Players can be resolved by name, including many
+                        # names of a tournament at once
+
+    testImportTime()    # Importing tournament stays fast, the database driver and
+                        # other optional dependencies are only imported when used
 
     testCompleteSwissPairing()
 